@@ -37,14 +37,26 @@ class Options(object):
 
   """
 
-  def __init__(self, ragged_checks, sparse_checks):
+  def __init__(self, ragged_checks, sparse_checks,
+               use_int32_indices=False,
+               prefer_embedding_lookup=False):
     """Create options."""
     self.ragged_checks = ragged_checks
     self.sparse_checks = sparse_checks
+    # If true, index gathers may dispatch through tf.nn.embedding_lookup,
+    # whose device placement can be preferable to tf.gather on GPU.
+    self.prefer_embedding_lookup = prefer_embedding_lookup
+    # If true, operations may cast int64 parent indices down to int32 for
+    # the duration of an index computation (e.g. the gather in promote),
+    # halving the bytes moved. Only safe when all parent dimensions fit in
+    # int32, so it is off by default.
+    self.use_int32_indices = use_int32_indices
 
   def __str__(self):
     return ("{ragged_checks:" + str(self.ragged_checks) + ", sparse_checks: " +
-            str(self.sparse_checks) + "}")
+            str(self.sparse_checks) + ", use_int32_indices: " +
+            str(self.use_int32_indices) + ", prefer_embedding_lookup: " +
+            str(self.prefer_embedding_lookup) + "}")
 
 
 def get_default_options():
@@ -36,61 +36,103 @@ from __future__ import division
 from __future__ import print_function
 
 import abc
+import collections
+import importlib
+
 from struct2tensor import calculate_options
 from struct2tensor import path
 from struct2tensor import prensor
 import tensorflow as tf
 from typing import Callable, FrozenSet, List, Mapping, Optional, Sequence, Union
 
-from tensorflow.python.util.lazy_loader import LazyLoader  # pylint: disable=g-direct-tensorflow-import
 from tensorflow_metadata.proto.v0 import schema_pb2
 
 # The purpose of this type is to make it easy to write down paths as literals.
 # If we made it Text instead of str, then it wouldn't be easy anymore.
 CoercableToPath = path.CoercableToPath
 
-# The LazyLoader is used to avoid a loop. All of the following packages depend
-# upon this one.
-# Similar to:
-# from struct2tensor.expression_impl import promote
-promote = LazyLoader("promote", globals(),
-                     "struct2tensor.expression_impl.promote")
-
-broadcast_module = LazyLoader("broadcast", globals(),
-                              "struct2tensor.expression_impl.broadcast")
-
-promote_and_broadcast = LazyLoader(
-    "broadcast", globals(), "struct2tensor.expression_impl"
-    ".promote_and_broadcast")
-
-map_values = LazyLoader("map_values", globals(),
-                        "struct2tensor.expression_impl.map_values")
-
-project = LazyLoader("project", globals(),
-                     "struct2tensor.expression_impl.project")
-
-size = LazyLoader("size", globals(), "struct2tensor.expression_impl.size")
-
-reroot = LazyLoader("reroot", globals(), "struct2tensor.expression_impl.reroot")
-
-map_prensor = LazyLoader("map_prensor", globals(),
-                         "struct2tensor.expression_impl.map_prensor")
-
-apply_schema = LazyLoader("apply_schema", globals(),
-                          "struct2tensor.expression_impl.apply_schema")
-
-slice_expression = LazyLoader("slice_expression", globals(),
-                              "struct2tensor.expression_impl.slice_expression")
+# The imports below are deferred to avoid a loop: all of the following
+# packages depend upon this one. Methods that need them import them locally
+# (cheap after the first import: a sys.modules lookup), and the module-level
+# __getattr__ keeps the old module attributes (e.g. expression.promote)
+# working for external callers.
+_LAZY_IMPORTS = {
+    "promote": "struct2tensor.expression_impl.promote",
+    "broadcast_module": "struct2tensor.expression_impl.broadcast",
+    "promote_and_broadcast": "struct2tensor.expression_impl"
+                             ".promote_and_broadcast",
+    "map_values": "struct2tensor.expression_impl.map_values",
+    "project": "struct2tensor.expression_impl.project",
+    "size": "struct2tensor.expression_impl.size",
+    "reroot": "struct2tensor.expression_impl.reroot",
+    "map_prensor": "struct2tensor.expression_impl.map_prensor",
+    "apply_schema": "struct2tensor.expression_impl.apply_schema",
+    "slice_expression": "struct2tensor.expression_impl.slice_expression",
+}
+
+
+def __getattr__(name):
+  """Resolves the deferred imports in _LAZY_IMPORTS (PEP 562)."""
+  module_name = _LAZY_IMPORTS.get(name)
+  if module_name is None:
+    raise AttributeError("module {!r} has no attribute {!r}".format(
+        __name__, name))
+  module = importlib.import_module(module_name)
+  globals()[name] = module
+  return module
 
 # Type for limit arguments to slice (begin, end).
 # Union[int, tf.Tensor, tf.Variable]
 IndexValue = Union[int, tf.Tensor, tf.Variable]  # pylint: disable=invalid-name
 
-
-class Expression(object):
+# Shared single-step paths, keyed by field name. get_known_descendants
+# creates one path per child per node; interning them avoids re-allocating
+# and re-validating equal paths for field names that recur across the tree.
+_SINGLETON_PATHS = {}
+
+# The empty path is inserted into every descendant map (one per node, most
+# of which are leaves), so share a single instance.
+_EMPTY_PATH = path.Path(())
+
+# Feature merged into children that have no schema feature and are not
+# repeated; a single MergeFrom of a prebuilt message is cheaper than going
+# through reflection for value_count.max on every such node.
+_OPTIONAL_FEATURE = schema_pb2.Feature()
+_OPTIONAL_FEATURE.value_count.max = 1
+
+# A flat, immutable view of the known tree of an expression, produced by
+# Expression.freeze(). paths, exprs and schema_features are parallel tuples
+# in depth-first pre-order; parent_idx[i] is the index of the parent of
+# exprs[i] (or -1 for the root). Consumers that repeatedly walk the tree can
+# iterate these tuples instead of re-dispatching through get_known_children.
+FrozenPlan = collections.namedtuple(
+    "FrozenPlan", ["paths", "exprs", "schema_features", "parent_idx"])
+
+# Number of cached children beyond which _child_cache switches from a tuple
+# of (name, child) pairs to a dict. Most nodes (leaves, narrow protos) cache
+# only a handful of children, for which a small tuple is both smaller than a
+# dict and at least as fast to scan.
+_CHILD_CACHE_DICT_THRESHOLD = 8
+
+
+class Expression(abc.ABC):
   """An expression represents the calculation of a prensor object."""
 
-  __metaclass__ = abc.ABCMeta
+  # Schema-wrapped trees allocate one Expression per field, so per-instance
+  # memory matters; __slots__ drops the instance __dict__ here and in
+  # subclasses that also declare it (others fall back to a __dict__ for
+  # their own attributes). __weakref__ is kept so instances can be held in
+  # weak caches.
+  __slots__ = [
+      "_is_repeated",
+      "_type",
+      "_child_cache",
+      "_schema_feature",
+      "_known_children_cache",
+      "_known_descendants_cache",
+      "_schema_string_cache",
+      "__weakref__",
+  ]
 
   def __init__(self,
                is_repeated,
@@ -106,8 +148,14 @@ class Expression(object):
     """
     self._is_repeated = is_repeated
     self._type = my_type
-    self._child_cache = {}
+    # Either a tuple of (name, child) pairs or, past
+    # _CHILD_CACHE_DICT_THRESHOLD entries, a dict. get_child owns the
+    # representation.
+    self._child_cache = ()
     self._schema_feature = schema_feature
+    self._known_children_cache = None
+    self._known_descendants_cache = None
+    self._schema_string_cache = {}
 
   @property
   def is_repeated(self):
@@ -241,10 +289,23 @@ class Expression(object):
 
   def get_child(self, field_name):
     """Gets a named child."""
-    if field_name in self._child_cache:
-      return self._child_cache[field_name]
+    cache = self._child_cache
+    if type(cache) is tuple:
+      for name, child in cache:
+        if name == field_name:
+          return child
+      result = self._get_child_impl(field_name)
+      if len(cache) < _CHILD_CACHE_DICT_THRESHOLD:
+        self._child_cache = cache + ((field_name, result),)
+      else:
+        new_cache = dict(cache)
+        new_cache[field_name] = result
+        self._child_cache = new_cache
+      return result
+    if field_name in cache:
+      return cache[field_name]
     result = self._get_child_impl(field_name)
-    self._child_cache[field_name] = result
+    cache[field_name] = result
     return result
 
   def get_child_or_error(self, field_name):
@@ -256,6 +317,9 @@ class Expression(object):
 
   def get_descendant(self, p):
     """Finds the descendant at the path."""
+    # get_child owns the two cache representations, so dispatch through it
+    # here; for small-arity nodes the tuple scan it performs is as cheap as
+    # an inlined dict probe.
     result = self
     for field_name in p.field_list:
       result = result.get_child(field_name)
@@ -272,10 +336,13 @@ class Expression(object):
     return result
 
   def get_known_children(self):
+    if self._known_children_cache is not None:
+      return self._known_children_cache
     known_field_names = self.known_field_names()
     result = {}
     for name in known_field_names:
       result[name] = self.get_child_or_error(name)
+    self._known_children_cache = result
     return result
 
   def get_known_descendants(self):
@@ -285,43 +352,56 @@ class Expression(object):
     The difference between this and get_descendants in Prensor is that
     all paths in a Prensor are known, in the sense that all
 
+    The result is computed once per expression and cached: expressions are
+    immutable, and children are themselves cached, so the mapping cannot
+    change once built.
 
     Returns:
       A mapping from paths (relative to the root of the subexpression) to
       expressions.
     """
+    if self._known_descendants_cache is not None:
+      return self._known_descendants_cache
     known_subexpressions = {
         k: v.get_known_descendants()
         for k, v in self.get_known_children().items()
     }
     result = {}
     for field_name, subexpression in known_subexpressions.items():
-      subexpression_path = path.Path([field_name])
+      subexpression_path = _SINGLETON_PATHS.setdefault(
+          field_name, path.Path((field_name,)))
       for p, expr in subexpression.items():
         result[subexpression_path.concat(p)] = expr
-    result[path.Path([])] = self
+    result[_EMPTY_PATH] = self
+    self._known_descendants_cache = result
     return result
 
   def _schema_string_helper(self, field_name,
                             limit):  # pylint: disable=g-ambiguous-str-annotation
     """Helper for schema_string."""
-    repeated_as_string = "repeated" if self.is_repeated else "optional"
-    if self.type is None:
-      result = ["{} {}:".format(repeated_as_string, str(field_name))]
-    else:
-      result = [
-          "{} {} {}".format(repeated_as_string, str(self.type), str(field_name))
-      ]
-    if limit is not None and limit == 0:
-      if self.get_known_children():
-        result.append("  ...")
-      return result
-
-    new_limit = None if limit is None else limit - 1
-
-    for field_name, subexpression in self.get_known_children().items():
-      recursive = subexpression._schema_string_helper(field_name, new_limit)  # pylint: disable=protected-access
-      result.extend(["  {}".format(x) for x in recursive])
+    result = []
+    # Entries are (expression, field name, depth, remaining limit). An
+    # iterative walk writes each line into the shared buffer exactly once,
+    # with its indentation computed from the depth, instead of re-indenting
+    # every line at every level of a recursion.
+    pending = [(self, field_name, 0, limit)]
+    while pending:
+      expr, name, depth, remaining = pending.pop()
+      prefix = "  " * depth
+      repeated_as_string = "repeated" if expr.is_repeated else "optional"
+      if expr.type is None:
+        result.append("{}{} {}:".format(prefix, repeated_as_string, str(name)))
+      else:
+        result.append("{}{} {} {}".format(prefix, repeated_as_string,
+                                          str(expr.type), str(name)))
+      known_children = expr.get_known_children()
+      if remaining is not None and remaining == 0:
+        if known_children:
+          result.append("{}  ...".format(prefix))
+        continue
+      new_limit = None if remaining is None else remaining - 1
+      for child_name, child in reversed(list(known_children.items())):
+        pending.append((child, child_name, depth + 1, new_limit))
     return result
 
   # Begin methods compatible with v1 API. ######################################
@@ -354,6 +434,7 @@ class Expression(object):
     Returns:
       A new query.
     """
+    from struct2tensor.expression_impl import map_prensor
     return map_prensor.map_sparse_tensor(
         self, path.create_path(parent_path),
         [path.Path([f]) for f in source_fields], operator, is_repeated, dtype,
@@ -387,6 +468,7 @@ class Expression(object):
     Returns:
       A new query.
     """
+    from struct2tensor.expression_impl import map_prensor
     return map_prensor.map_ragged_tensor(
         self, path.create_path(parent_path),
         [path.Path([f]) for f in source_fields], operator, is_repeated, dtype,
@@ -417,27 +499,32 @@ class Expression(object):
     Returns:
       An Expression object representing the result of the operation.
     """
+    from struct2tensor.expression_impl import slice_expression
     return slice_expression.slice_expression(self,
                                              path.create_path(source_path),
                                              new_field_name, begin, end)
 
   def promote(self, source_path, new_field_name):
     """Promotes source_path to be a field new_field_name in its grandparent."""
+    from struct2tensor.expression_impl import promote
     return promote.promote(self, path.create_path(source_path), new_field_name)
 
   def broadcast(self, source_path, sibling_field,
                 new_field_name):
     """Broadcasts the existing field at source_path to the sibling_field."""
+    from struct2tensor.expression_impl import broadcast as broadcast_module
     return broadcast_module.broadcast(self, path.create_path(source_path),
                                       sibling_field, new_field_name)
 
   def project(self, path_list):
     """Constrains the paths to those listed."""
+    from struct2tensor.expression_impl import project
     return project.project(self, [path.create_path(x) for x in path_list])
 
   def promote_and_broadcast(
       self, path_dictionary,
       dest_path_parent):
+    from struct2tensor.expression_impl import promote_and_broadcast
     return promote_and_broadcast.promote_and_broadcast(
         self, {k: path.create_path(v) for k, v in path_dictionary.items()},
         path.create_path(dest_path_parent))
@@ -459,21 +546,25 @@ class Expression(object):
     Returns:
       the resulting root expression.
     """
+    from struct2tensor.expression_impl import map_values
     return map_values.map_values(self, path.create_path(source_path), operator,
                                  dtype, new_field_name)
 
   def reroot(self, new_root):
     """Returns a new list of protocol buffers available at new_root."""
+    from struct2tensor.expression_impl import reroot
     return reroot.reroot(self, path.create_path(new_root))
 
   def create_size_field(self, source_path,
                         new_field_name):
     """Creates a field that is the size of the source path."""
+    from struct2tensor.expression_impl import size
     return size.size(self, path.create_path(source_path), new_field_name)
 
   def create_has_field(self, source_path,
                        new_field_name):
     """Creates a field that is the presence of the source path."""
+    from struct2tensor.expression_impl import size
     return size.has(self, path.create_path(source_path), new_field_name)
 
   def create_proto_index(self, field_name):
@@ -492,6 +583,7 @@ class Expression(object):
       An Expression object representing the result of the operation.
     """
 
+    from struct2tensor.expression_impl import reroot
     return reroot.create_proto_index_field(self, field_name)
 
   def cogroup_by_index(self, source_path, left_name,
@@ -507,6 +599,7 @@ class Expression(object):
     return transform(self)
 
   def apply_schema(self, schema):
+    from struct2tensor.expression_impl import apply_schema
     return apply_schema.apply_schema(self, schema)
 
   def _populate_schema_feature_children(self, feature_list):
@@ -518,17 +611,60 @@ class Expression(object):
     Args:
       feature_list: RepeatedCompositeFieldContainer of schema_pb2.Feature.
     """
-    for name, child in self.get_known_children().items():
-      new_feature = feature_list.add()
-      if child.schema_feature is None:
-        if not child.is_repeated:
-          new_feature.value_count.max = 1
-      else:
-        new_feature.CopyFrom(child.schema_feature)
-      if child.get_known_children():
-        child._populate_schema_feature_children(  # pylint:disable=protected-access
-            new_feature.struct_domain.feature)
-      new_feature.name = name
+    to_populate = [(self, feature_list)]
+    while to_populate:
+      node, node_feature_list = to_populate.pop()
+      # Build the features of one level locally and attach them with a
+      # single extend, which resizes the repeated field once instead of
+      # paying an add() round-trip per child.
+      built = []
+      nested = []
+      for name, child in node.get_known_children().items():
+        new_feature = schema_pb2.Feature()
+        if child.schema_feature is None:
+          if not child.is_repeated:
+            new_feature.MergeFrom(_OPTIONAL_FEATURE)
+        else:
+          new_feature.CopyFrom(child.schema_feature)
+        new_feature.name = name
+        built.append(new_feature)
+        if child.get_known_children():
+          nested.append((len(built) - 1, child))
+      start = len(node_feature_list)
+      node_feature_list.extend(built)
+      # extend copies the messages, so recurse into the copies that now
+      # live inside the container.
+      for index, child in nested:
+        to_populate.append(
+            (child, node_feature_list[start + index].struct_domain.feature))
+
+  def freeze(self):
+    """Materializes the known tree as a flat FrozenPlan.
+
+    The plan lists every known descendant once, in depth-first pre-order,
+    as parallel tuples of path, expression, schema feature and parent
+    index. Because expressions are immutable, the plan stays valid and can
+    be iterated repeatedly without walking the tree again.
+
+    Returns:
+      A FrozenPlan for this expression.
+    """
+    paths = []
+    exprs = []
+    schema_features = []
+    parent_idx = []
+    pending = [(_EMPTY_PATH, self, -1)]
+    while pending:
+      p, node, parent = pending.pop()
+      index = len(paths)
+      paths.append(p)
+      exprs.append(node)
+      schema_features.append(node.schema_feature)
+      parent_idx.append(parent)
+      for name, child in reversed(list(node.get_known_children().items())):
+        pending.append((p.get_child(name), child, index))
+    return FrozenPlan(
+        tuple(paths), tuple(exprs), tuple(schema_features), tuple(parent_idx))
 
   def get_schema(self):
     """Returns a schema for the entire tree."""
@@ -555,7 +691,14 @@ class Expression(object):
     Returns:
       A string, describing (a part of) the schema.
     """
-    return "\n".join(self._schema_string_helper("root", limit))
+    # Cached per limit: the string is a pure function of the immutable tree,
+    # and error paths (get_descendant_or_error) and __str__ can request it
+    # repeatedly.
+    result = self._schema_string_cache.get(limit)
+    if result is None:
+      result = "\n".join(self._schema_string_helper("root", limit))
+      self._schema_string_cache[limit] = result
+    return result
 
   def __str__(self):  # pylint: disable=g-ambiguous-str-annotation
     """If not overridden, returns the schema string."""
@@ -566,6 +709,8 @@ class Expression(object):
 class Leaf(Expression):
   """An abstract supertype for expression subtypes without any children."""
 
+  __slots__ = []
+
   def __init__(self,
                is_repeated,
                my_type,
@@ -128,10 +128,13 @@ def add_paths(root,
   Returns:
     a new tree with the nodes from the root and the new subtrees.
   """
+  # Walk to each parent once and probe its child directly: walking the full
+  # path a second time for the child re-descends the same prefix.
   for p in path_map.keys():
-    if root.get_descendant(p.get_parent()) is None:
+    parent_expr = root.get_descendant(p.get_parent())
+    if parent_expr is None:
       raise ValueError("No parent of {}".format(p))
-    if root.get_descendant(p) is not None:
+    if parent_expr.get_child(p.field_list[-1]) is not None:
       raise ValueError("Path already set: {}".format(str(p)))
   _, map_of_maps = create_subtrees(path_map)
   return _AddPathsExpression(root, map_of_maps)
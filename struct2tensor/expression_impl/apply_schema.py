@@ -51,7 +51,8 @@ from __future__ import division
 
 from __future__ import print_function
 
-import abc
+import weakref
+
 from struct2tensor import calculate_options
 from struct2tensor import expression
 from struct2tensor import path
@@ -60,18 +61,29 @@ from typing import FrozenSet, Optional, Sequence
 
 from tensorflow_metadata.proto.v0 import schema_pb2
 
+# Maps (id(original_child), id(feature)) to the _SchemaExpression wrapping
+# them, so re-applying the same schema over cached subtrees reuses nodes
+# instead of rebuilding (and re-cleaning) them. The wrapper holds strong
+# references to both key objects, so an entry can never outlive them and the
+# ids cannot be recycled while the entry is alive.
+_applied_feature_cache = weakref.WeakValueDictionary()
+
 
 def apply_schema(expr,
                  schema):
-  schema_copy = schema_pb2.Schema()
-  schema_copy.CopyFrom(schema)
+  string_domain_by_name = {d.name: d for d in schema.string_domain}
+  int_domain_by_name = {d.name: d for d in schema.int_domain}
+  float_domain_by_name = {d.name: d for d in schema.float_domain}
   for x in schema.feature:
-    _normalize_feature(x, schema)
+    _normalize_feature(x, string_domain_by_name, int_domain_by_name,
+                       float_domain_by_name)
   return _SchemaExpression(expr, schema.feature, None)
 
 
 def _normalize_feature(feature,
-                       schema):
+                       string_domain_by_name,
+                       int_domain_by_name,
+                       float_domain_by_name):
   """Make each feature self-contained.
 
   If the feature references a global domain, copy the global domain locally.
@@ -82,53 +94,60 @@ def _normalize_feature(feature,
 
   Args:
     feature: feature to modify in place.
-    schema: schema containing any global domains.
+    string_domain_by_name: the schema's string domains, keyed by name.
+    int_domain_by_name: the schema's int domains, keyed by name.
+    float_domain_by_name: the schema's float domains, keyed by name.
   """
 
   if feature.HasField("struct_domain"):
     for x in feature.struct_domain.feature:
-      _normalize_feature(x, schema)
+      _normalize_feature(x, string_domain_by_name, int_domain_by_name,
+                         float_domain_by_name)
   if feature.HasField("domain"):
-    for string_domain in schema.string_domain:
-      if string_domain.name == feature.domain:
-        feature.string_domain.CopyFrom(string_domain)
-        return
-    for int_domain in schema.int_domain:
-      if int_domain.name == feature.domain:
-        feature.int_domain.CopyFrom(int_domain)
-        return
-    for float_domain in schema.float_domain:
-      if float_domain.name == feature.domain:
-        feature.float_domain.CopyFrom(float_domain)
-        return
-    raise ValueError("Did not find domain {} in schema {}".format(
-        feature.domain, schema))
-
-
-def _clean_feature(feature):
-  """Remove name and all children of a feature (if any exist).
-
-  Args:
-    feature: feature that is cleaned in place.
-  """
-  feature.ClearField("name")
-  if feature.HasField("struct_domain"):
-    del feature.struct_domain.feature[:]
+    string_domain = string_domain_by_name.get(feature.domain)
+    if string_domain is not None:
+      feature.string_domain.CopyFrom(string_domain)
+      return
+    int_domain = int_domain_by_name.get(feature.domain)
+    if int_domain is not None:
+      feature.int_domain.CopyFrom(int_domain)
+      return
+    float_domain = float_domain_by_name.get(feature.domain)
+    if float_domain is not None:
+      feature.float_domain.CopyFrom(float_domain)
+      return
+    raise ValueError("Did not find domain {} in schema".format(feature.domain))
 
 
 def _apply_feature(original_child,
                    feature):
   """Apply a feature to an expression. Feature should be "unclean"."""
-  feature_copy = [x for x in feature.struct_domain.feature
-                 ] if feature.HasField("struct_domain") else []
-  _clean_feature(feature)
-  return _SchemaExpression(original_child, feature_copy, feature)
+  cache_key = (id(original_child), id(feature))
+  result = _applied_feature_cache.get(cache_key)
+  if result is not None:
+    return result
+  # Clean the feature in place: remove its name and detach its children,
+  # which become the child features of the new expression.
+  feature.ClearField("name")
+  if feature.HasField("struct_domain"):
+    feature_copy = list(feature.struct_domain.feature)
+    feature.struct_domain.ClearField("feature")
+  else:
+    feature_copy = []
+  result = _SchemaExpression(original_child, feature_copy, feature)
+  _applied_feature_cache[cache_key] = result
+  return result
 
 
 class _SchemaExpression(expression.Expression):
   """An expression represents the application of a schema."""
 
-  __metaclass__ = abc.ABCMeta
+  __slots__ = [
+      "_original",
+      "_child_features",
+      "_feature_by_name",
+      "_known_field_names_cache",
+  ]
 
   def __init__(self, original,
                child_features,
@@ -144,6 +163,8 @@ class _SchemaExpression(expression.Expression):
         original.is_repeated, original.type, schema_feature=schema_feature)
     self._original = original
     self._child_features = child_features
+    self._feature_by_name = {f.name: f for f in child_features}
+    self._known_field_names_cache = None
 
   def get_source_expressions(self):
     return [self._original]
@@ -163,10 +184,7 @@ class _SchemaExpression(expression.Expression):
 
   def _find_feature_proto(self, field_name
                          ):
-    for feature in self._child_features:
-      if feature.name == field_name:
-        return feature
-    return None
+    return self._feature_by_name.get(field_name)
 
   def _get_child_impl(self,
                       field_name):
@@ -179,10 +197,15 @@ class _SchemaExpression(expression.Expression):
     return _apply_feature(original_child, feature_proto)
 
   def known_field_names(self):
+    if self._known_field_names_cache is not None:
+      return self._known_field_names_cache
     result = set(self._original.known_field_names())
-    for feature_proto in self._child_features:
-      field_name = str(feature_proto.name)
-      associated_child = self.get_child(field_name)
-      if associated_child is not None:
-        result.add(field_name)
-    return frozenset(result)
+    for field_name in self._feature_by_name:
+      # Probe the original expression only: a field is known iff it exists
+      # there, and this avoids constructing a _SchemaExpression wrapper for
+      # every feature just to enumerate names.
+      if self._original.get_child(str(field_name)) is not None:
+        result.add(str(field_name))
+    result = frozenset(result)
+    self._known_field_names_cache = result
+    return result
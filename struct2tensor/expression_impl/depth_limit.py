@@ -40,19 +40,72 @@ from __future__ import division
 
 from __future__ import print_function
 
+import weakref
+
 from struct2tensor import calculate_options
 from struct2tensor import expression
 from struct2tensor import path
 from struct2tensor import prensor
 from typing import FrozenSet, Optional, Sequence
 
+# Shared by every expression with no known fields; known_field_names is
+# called repeatedly during traversal and should not allocate.
+_EMPTY_FIELD_NAMES = frozenset()
+
+# Maps id(origin) to its inert zero-depth wrapper. The wrapper holds a strong
+# reference to the origin, so an entry can never outlive it and the id cannot
+# be recycled while the entry is alive.
+_zero_depth_cache = weakref.WeakValueDictionary()
+
+
+def _zero_depth(origin):
+  """Returns the shared inert wrapper for origin."""
+  result = _zero_depth_cache.get(id(origin))
+  if result is None:
+    result = _ZeroDepthExpression(origin)
+    _zero_depth_cache[id(origin)] = result
+  return result
+
 
 def limit_depth(expr,
                 depth_limit):
   """Limit the depth to nodes k steps from expr."""
+  if depth_limit <= 0:
+    return _zero_depth(expr)
   return _DepthLimitExpression(expr, depth_limit)
 
 
+class _ZeroDepthExpression(expression.Expression):
+  """An identity wrapper with no known fields and no children."""
+
+  def __init__(self, origin):
+    super(_ZeroDepthExpression, self).__init__(origin.is_repeated, origin.type)
+    self._origin = origin
+
+  def get_source_expressions(self):
+    return [self._origin]
+
+  def calculate(self, sources,
+                destinations,
+                options):
+    if len(sources) != 1:
+      raise ValueError("Expected one source.")
+    return sources[0]
+
+  def calculation_is_identity(self):
+    return True
+
+  def calculation_equal(self, expr):
+    return expr.calculation_is_identity()
+
+  def _get_child_impl(self,
+                      field_name):
+    return None
+
+  def known_field_names(self):
+    return _EMPTY_FIELD_NAMES
+
+
 class _DepthLimitExpression(expression.Expression):
   """Project all subfields of an expression."""
 
@@ -60,6 +113,7 @@ class _DepthLimitExpression(expression.Expression):
     super(_DepthLimitExpression, self).__init__(origin.is_repeated, origin.type)
     self._origin = origin
     self._depth_limit = depth_limit
+    self._known_names = None
 
   def get_source_expressions(self):
     return [self._origin]
@@ -79,14 +133,24 @@ class _DepthLimitExpression(expression.Expression):
 
   def _get_child_impl(self,
                       field_name):
-    if self._depth_limit == 0:
+    depth_limit = self._depth_limit
+    if depth_limit == 0:
       return None
     origin_child = self._origin.get_child(field_name)
     if origin_child is None:
       return None
-    return _DepthLimitExpression(origin_child, self._depth_limit - 1)
+    if depth_limit == 1:
+      return _zero_depth(origin_child)
+    return _DepthLimitExpression(origin_child, depth_limit - 1)
 
   def known_field_names(self):
-    if self._depth_limit == 0:
-      return frozenset()
-    return self._origin.known_field_names()
+    # Cached: delegating to the origin walks the whole wrapper chain on
+    # deep trees. Child wrappers are already memoized by the base class's
+    # get_child cache.
+    known_names = self._known_names
+    if known_names is None:
+      known_names = (
+          _EMPTY_FIELD_NAMES
+          if self._depth_limit == 0 else self._origin.known_field_names())
+      self._known_names = known_names
+    return known_names
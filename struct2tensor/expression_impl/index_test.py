@@ -82,15 +82,8 @@ class GetIndexValuesTest(tf.test.TestCase):
           prensor_test_util.create_nested_prensor())
       new_root, new_path = index.get_index_from_end(
           expr, path.Path(["user", "friends"]), path.get_anonymous_field())
-      print("test_get_index_from_end_calculate: new_path: {}".format(new_path))
       new_field = new_root.get_descendant_or_error(new_path)
-      print("test_get_index_from_end_calculate: new_field: {}".format(
-          str(new_field)))
-
       leaf_node = expression_test_util.calculate_value_slowly(new_field)
-      print("test_get_index_from_end_calculate: leaf_node: {}".format(
-          str(leaf_node)))
-
       [parent_index,
        values] = sess.run([leaf_node.parent_index, leaf_node.values])
 
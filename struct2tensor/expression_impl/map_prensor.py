@@ -94,6 +94,8 @@ from __future__ import division
 
 from __future__ import print_function
 
+import logging
+
 from struct2tensor import calculate_options
 from struct2tensor import expression
 from struct2tensor import expression_add
@@ -104,6 +106,12 @@ from struct2tensor.expression_impl import project
 import tensorflow as tf
 from typing import Callable, FrozenSet, Optional, Sequence, Tuple
 
+_logger = logging.getLogger(__name__)
+
+# Shared by every expression with no known fields; known_field_names is
+# called repeatedly during traversal and should not allocate.
+_EMPTY_FIELD_NAMES = frozenset()
+
 
 def map_sparse_tensor(root, root_path,
                       paths,
@@ -177,25 +185,29 @@ class _MapPrensorExpression(expression.Expression):
     super(_MapPrensorExpression, self).__init__(is_repeated, dtype)
     self._origin = origin
     self._operation = operation
+    self._source_paths = None
 
   def _get_source_paths(self):
     """Returns the source paths in a deterministic order."""
-    result = [k for k in self._origin.get_known_descendants().keys()]
-    result.sort()
-    return result
+    # Computed once: get_source_expressions and calculate both need the
+    # sorted paths, and each descendant walk and sort is pure overhead on
+    # wide subtrees.
+    source_paths = self._source_paths
+    if source_paths is None:
+      source_paths = tuple(sorted(self._origin.get_known_descendants()))
+      self._source_paths = source_paths
+    return source_paths
 
   def get_source_expressions(self):
     subtree = self._origin.get_known_descendants()
-    source_paths = self._get_source_paths()
-    return [subtree[k] for k in source_paths]
+    return [subtree[k] for k in self._get_source_paths()]
 
   def calculate(self, sources,
                 destinations,
                 options):
-    print("map_prensor:calculate:options:{}".format(options))
-
+    _logger.debug("map_prensor:calculate:options:%s", options)
     source_tree = prensor.create_prensor_from_descendant_nodes(
-        {k: v for k, v in zip(self._get_source_paths(), sources)})
+        dict(zip(self._get_source_paths(), sources)))
     return self._operation(source_tree, options)
 
   def calculation_is_identity(self):
@@ -209,15 +221,21 @@ class _MapPrensorExpression(expression.Expression):
     return None
 
   def known_field_names(self):
-    return frozenset()
+    return _EMPTY_FIELD_NAMES
 
 
 def _as_leaf_node_no_checks(sparse_tensor,
                             is_repeated):
   """Take a SparseTensor and create a LeafNodeTensor, no checks."""
   if is_repeated:
-    parent_index = tf.transpose(sparse_tensor.indices)[0]
+    # A strided slice of the first column; transposing would materialize the
+    # whole Nx2 index matrix just to read half of it.
+    parent_index = sparse_tensor.indices[:, 0]
   else:
+    # reshape rather than squeeze: this path must tolerate indices whose
+    # static shape disagrees with is_repeated (see
+    # test_map_sparse_tensor_assert), and squeeze rejects them at graph
+    # build.
     parent_index = tf.reshape(sparse_tensor.indices, [-1])
   return prensor.LeafNodeTensor(parent_index, sparse_tensor.values, is_repeated)
 
@@ -227,13 +245,10 @@ def _as_leaf_node_with_checks(sparse_tensor, is_repeated,
                              ):
   """Take a SparseTensor and create a LeafNodeTensor, with checks."""
   assertions = [
-      tf.assert_equal(sparse_tensor.dense_shape[0], required_batch_size)
+      tf.assert_equal(sparse_tensor.dense_shape[0], required_batch_size),
+      tf.assert_equal(
+          tf.shape(sparse_tensor.indices)[1], 2 if is_repeated else 1)
   ]
-  if is_repeated:
-    assertions.append(tf.assert_equal(tf.shape(sparse_tensor.indices)[1], 2))
-  else:
-    assertions.append(tf.assert_equal(tf.shape(sparse_tensor.indices)[1], 1))
-
   with tf.control_dependencies(assertions):
     # TODO(b/72947444): Check that the resulting tensor is canonical, that the
     # indices are in lexicographical order, and that the indices fit in the
@@ -246,11 +261,11 @@ def _as_leaf_node(sparse_tensor, is_repeated,
                   required_batch_size,
                   options):
   if options.sparse_checks:
-    print("Using sparse_checks")
+    _logger.debug("_as_leaf_node: using sparse_checks")
     return _as_leaf_node_with_checks(sparse_tensor, is_repeated,
                                      required_batch_size)
   else:
-    print("NOT Using sparse_checks")
+    _logger.debug("_as_leaf_node: not using sparse_checks")
     return _as_leaf_node_no_checks(sparse_tensor, is_repeated)
 
 
@@ -298,6 +313,10 @@ def _ragged_as_leaf_node(ragged_tensor, is_repeated,
                          options
                         ):
   """Creates a ragged tensor as a leaf node."""
+  # Computed once and reused below: each value_rowids() call adds another
+  # copy of the rowids computation to the graph.
+  rowids = ragged_tensor.value_rowids()
+  values = ragged_tensor.values
   assertions = []
   if (ragged_tensor.shape[0].value is not None and
       reference_ragged_tensor.shape[0].value is not None):
@@ -307,19 +326,14 @@ def _ragged_as_leaf_node(ragged_tensor, is_repeated,
     assertions.append(
         tf.assert_equal(ragged_tensor.nrows(), reference_ragged_tensor.nrows()))
 
-  if not is_repeated:
-    rowids = ragged_tensor.value_rowids()
-    if options.ragged_checks:
-      assertions.append(tf.compat.v1.assert_positive(rowids[1:] - rowids[:-1]))
+  if not is_repeated and options.ragged_checks:
+    assertions.append(tf.compat.v1.assert_positive(rowids[1:] - rowids[:-1]))
   if assertions:
     with tf.control_dependencies(assertions):
-      parent_index = ragged_tensor.value_rowids()
-      return prensor.LeafNodeTensor(parent_index, ragged_tensor.values,
-                                    is_repeated)
+      parent_index = tf.identity(rowids)
+      return prensor.LeafNodeTensor(parent_index, values, is_repeated)
   else:
-    parent_index = ragged_tensor.value_rowids()
-    return prensor.LeafNodeTensor(parent_index, ragged_tensor.values,
-                                  is_repeated)
+    return prensor.LeafNodeTensor(rowids, values, is_repeated)
 
 
 def _map_ragged_tensor_impl(root, root_path,
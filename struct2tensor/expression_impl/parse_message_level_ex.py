@@ -73,7 +73,6 @@ from __future__ import print_function
 
 # pylint: disable=protected-access
 
-import collections
 from struct2tensor import path
 from struct2tensor.ops import struct2tensor_ops
 import tensorflow as tf
@@ -88,24 +87,41 @@ ProtoFullName = str  # pylint: disable=g-ambiguous-str-annotation
 # A string representing a step in a path.
 StrStep = str  # pylint: disable=g-ambiguous-str-annotation
 
+# The fields of google.protobuf.Any needed to decode any extension step.
+_ANY_DECODE_FIELDS = frozenset({"type_url", "value"})
+
 
 def parse_message_level_ex(tensor_of_protos,
                            desc,
                            field_names
                           ):
   """Parses regular fields, extensions, any casts, and map protos."""
-  raw_field_names = _get_field_names_to_parse(desc, field_names)
+  # Classify each field name once: is_map_indexing_step, is_extension and
+  # parse_map_indexing_step all re-parse the step string, so running them in
+  # every helper would re-parse every name three times.
+  raw_field_names = set()
+  any_field_names = []
+  map_entries = []
+  is_any = is_any_descriptor(desc)
+  for x in field_names:
+    if path.is_map_indexing_step(x):
+      map_field_name, key = path.parse_map_indexing_step(x)
+      map_entries.append((x, map_field_name, key))
+      raw_field_names.add(map_field_name)
+    elif is_any and path.is_extension(x):
+      any_field_names.append(x)
+    else:
+      raw_field_names.add(x)
+  if any_field_names:
+    raw_field_names |= _ANY_DECODE_FIELDS
   regular_fields = list(
       struct2tensor_ops.parse_message_level(tensor_of_protos, desc,
-                                            raw_field_names))
+                                            list(raw_field_names)))
   regular_field_map = {x.field_name: x for x in regular_fields}
 
-  any_fields = _get_any_parsed_fields(desc, regular_field_map, field_names)
-  map_fields = _get_map_parsed_fields(desc, regular_field_map, field_names)
-  result = regular_field_map
-  result.update(any_fields)
-  result.update(map_fields)
-  return result
+  any_fields = _get_any_parsed_fields(regular_field_map, any_field_names)
+  map_fields = _get_map_parsed_fields(desc, regular_field_map, map_entries)
+  return {**regular_field_map, **any_fields, **map_fields}
 
 
 def is_any_descriptor(desc):
@@ -137,32 +153,27 @@ def get_full_name_from_any_step(
 
 
 def _any_indices_with_type(type_url,
+                           last_component,
                            full_name):
   """Returns the parent indices that have a type_url of full_name."""
-  tensors_parsed = tf.string_split(type_url.value, delimiter="/")
-  second_column_shape = tf.stack([
-      tf.shape(type_url.value, out_type=tf.int64)[0],
-      tf.constant(1, dtype=tf.int64)
-  ],
-                                 axis=0)
-  second_column = tf.reshape(
-      tf.sparse_tensor_to_dense(
-          tf.sparse_slice(tensors_parsed, tf.constant([0, 1], dtype=tf.int64),
-                          second_column_shape),
-          default_value=""), [-1])
-  equal_to_full_name = tf.equal(second_column, full_name)
+  equal_to_full_name = tf.equal(last_component, full_name)
   return tf.boolean_mask(type_url.index, equal_to_full_name)
 
 
 def _get_any_parsed_field(value_field,
                           type_url_field,
+                          last_component,
                           field_name
                          ):
   """Helper function for _get_any_parsed_fields."""
   full_name = get_full_name_from_any_step(field_name)
-  indices_with_type = _any_indices_with_type(type_url_field, full_name)
+  indices_with_type = _any_indices_with_type(type_url_field, last_component,
+                                             full_name)
   [index_to_solution_index, index_to_values
   ] = struct2tensor_ops.equi_join_indices(indices_with_type, value_field.index)
+  # The two gathers cannot be fused into one: they read tensors of
+  # different dtypes (int64 parent indices vs. the field values) with
+  # different index tensors from the join.
   solution_index = tf.gather(indices_with_type, index_to_solution_index)
   solution_value = tf.gather(value_field.value, index_to_values)
   # TODO(martinz): make _ParsedField public.
@@ -174,72 +185,68 @@ def _get_any_parsed_field(value_field,
 
 
 def _get_any_parsed_fields(
-    desc,
     raw_parsed_fields,
-    field_names
+    any_field_names
 ):
   """Gets the _ParsedField sequence for an Any protobuf."""
-  if not is_any_descriptor(desc):
+  if not any_field_names:
     return {}
 
+  value_field = raw_parsed_fields["value"]
+  type_url_field = raw_parsed_fields["type_url"]
+  # The trailing "/"-delimited component of a type URL is the proto full
+  # name. Stripping everything up to the last slash with one regex op
+  # replaces the old string_split -> sparse_slice -> sparse_to_dense ->
+  # reshape pipeline that materialized a padded dense matrix, and unlike a
+  # ragged split it works on every supported TF version. It is computed
+  # once and shared by every requested extension name.
+  last_component = tf.strings.regex_replace(
+      type_url_field.value, r"(?s).*/", "", replace_global=False)
+
   result = []  # type: List[struct2tensor_ops._ParsedField]
 
-  for x in field_names:
-    if path.is_extension(x):
-      result.append(
-          _get_any_parsed_field(raw_parsed_fields["value"],
-                                raw_parsed_fields["type_url"], x))
+  for x in any_field_names:
+    result.append(
+        _get_any_parsed_field(value_field, type_url_field, last_component, x))
   return {x.field_name: x for x in result}
 
 
-def _get_field_names_to_parse(
-    desc,
-    needed_field_names):
-  """Gets the field names to parse from the original protobuf."""
-  result = set()  # Set[ProtoFieldName]
-  for x in needed_field_names:
-    if path.is_map_indexing_step(x):
-      map_field_name, _ = path.parse_map_indexing_step(x)
-      result.add(map_field_name)
-    elif path.is_extension(x) and is_any_descriptor(desc):
-      result.add("type_url")
-      result.add("value")
-    else:
-      result.add(x)
-  return list(result)
-
-
 def _get_map_parsed_fields(
     desc,
     regular_fields,
-    field_names
+    map_entries
 ):
   """Gets the map proto ParsedFields.
 
-  field_names includes all the fields: map fields, any fields, and
-  regular fields.
-
   Args:
     desc: the descriptor of the parent proto.
     regular_fields: the fields that are parsed directly from the proto.
-    field_names: all fields needed: map fields, any fields, and regular fields.
+    map_entries: (step, map field name, key) triples, one per requested map
+      indexing step.
 
   Returns:
     A map from field names to ParsedFields, only for the field names of the form
     foo[bar].
   """
-  maps_to_parse = collections.defaultdict(dict)
-  for x in field_names:
-    if path.is_map_indexing_step(x):
-      map_field_name, key = path.parse_map_indexing_step(x)
-      maps_to_parse[map_field_name][key] = x
-  result_as_list = []
+  if not map_entries:
+    return {}
+  maps_to_parse = {}
+  for x, map_field_name, key in map_entries:
+    maps_to_parse.setdefault(map_field_name, {})[key] = x
+  # Resolve the inputs of every distinct map field first, then issue the
+  # parse ops back to back: they have no inter-dependence, so the TF
+  # executor is free to run them in parallel. fields_by_name is bound once
+  # to avoid a descriptor-property lookup per map field.
+  fields_by_name = desc.fields_by_name
+  parse_inputs = []
   for map_field_name, v in maps_to_parse.items():
     parsed_map_field = regular_fields[map_field_name]
-    keys_needed = list(v.keys())
-    map_field_value = parsed_map_field.value
-    map_field_index = parsed_map_field.index
-    map_field_desc = desc.fields_by_name[map_field_name].message_type
+    parse_inputs.append((v, list(v.keys()), parsed_map_field.value,
+                         parsed_map_field.index,
+                         fields_by_name[map_field_name].message_type))
+  result_as_list = []
+  for (v, keys_needed, map_field_value, map_field_index,
+       map_field_desc) in parse_inputs:
     values_and_parent_indices = struct2tensor_ops.parse_proto_map(
         map_field_value, map_field_index, map_field_desc, keys_needed)
     for map_key, [value, parent_index] in zip(keys_needed,
@@ -251,12 +258,3 @@ def _get_map_parsed_fields(
               index=parent_index,
               value=value))
   return {x.field_name: x for x in result_as_list}
-
-
-def _get_parsed_field(data,
-                      field_name
-                     ):
-  for x in data:
-    if x.field_name == field_name:
-      return x
-  return None
@@ -95,6 +95,8 @@ from __future__ import division
 
 from __future__ import print_function
 
+import weakref
+
 from struct2tensor import calculate_options
 from struct2tensor import expression
 from struct2tensor import expression_add
@@ -109,6 +111,8 @@ from tensorflow_metadata.proto.v0 import schema_pb2
 class PromoteExpression(expression.Leaf):
   """A promoted leaf."""
 
+  __slots__ = ["_origin", "_origin_parent"]
+
   def __init__(self, origin,
                origin_parent):
 
@@ -136,8 +140,19 @@ class PromoteExpression(expression.Leaf):
     if not isinstance(origin_parent_value, prensor.ChildNodeTensor):
       raise ValueError("origin_parent_value must be a child node")
     parent_to_grandparent_index = origin_parent_value.parent_index
-    new_parent_index = tf.gather(parent_to_grandparent_index,
-                                 origin_value.parent_index)
+    if options.prefer_embedding_lookup:
+      new_parent_index = tf.nn.embedding_lookup(parent_to_grandparent_index,
+                                                origin_value.parent_index)
+    elif options.use_int32_indices:
+      # Gather over int32 halves the bytes moved; the result is cast back
+      # because parent indices are int64 throughout the library.
+      new_parent_index = tf.cast(
+          tf.gather(
+              tf.cast(parent_to_grandparent_index, tf.int32),
+              tf.cast(origin_value.parent_index, tf.int32)), tf.int64)
+    else:
+      new_parent_index = tf.gather(parent_to_grandparent_index,
+                                   origin_value.parent_index)
     return prensor.LeafNodeTensor(new_parent_index, origin_value.values,
                                   self.is_repeated)
 
@@ -148,23 +163,17 @@ class PromoteExpression(expression.Leaf):
     return isinstance(expr, PromoteExpression)
 
 
-def _lifecycle_stage_number(a):
-  """Return a number indicating the quality of the lifecycle stage.
-
-  When there is more than one input field, the minimum lifecycle stage could be
-  used.
-
-  Args:
-    a: an Optional[LifecycleStage]
-  Returns: an integer
-  """
-  stages = [
-      schema_pb2.LifecycleStage.DEPRECATED, schema_pb2.LifecycleStage.PLANNED,
-      schema_pb2.LifecycleStage.ALPHA, schema_pb2.LifecycleStage.DEBUG_ONLY,
-      None, schema_pb2.LifecycleStage.UNKNOWN_STAGE,
-      schema_pb2.LifecycleStage.BETA, schema_pb2.LifecycleStage.PRODUCTION
-  ]
-  return stages.index(a)
+# Ranks each Optional[LifecycleStage] by quality. When there is more than
+# one input field, the minimum lifecycle stage could be used.
+_STAGE_RANK = {
+    stage: rank for rank, stage in enumerate([
+        schema_pb2.LifecycleStage.DEPRECATED,
+        schema_pb2.LifecycleStage.PLANNED, schema_pb2.LifecycleStage.ALPHA,
+        schema_pb2.LifecycleStage.DEBUG_ONLY, None,
+        schema_pb2.LifecycleStage.UNKNOWN_STAGE,
+        schema_pb2.LifecycleStage.BETA, schema_pb2.LifecycleStage.PRODUCTION
+    ])
+}
 
 
 def _min_lifecycle_stage(a, b):
@@ -177,7 +186,7 @@ def _min_lifecycle_stage(a, b):
   Returns:
     the minimal lifecycle stage.
   """
-  if _lifecycle_stage_number(b) < _lifecycle_stage_number(a):
+  if _STAGE_RANK[b] < _STAGE_RANK[a]:
     return b
   return a
 
@@ -189,6 +198,15 @@ def _feature_is_dense(feature):
           feature.value_count.min == feature.value_count.max)
 
 
+# The domain_info oneof is fixed at class load time; caching whether each
+# member is a message (CopyFrom) or a scalar (setattr) avoids descriptor
+# reflection on every promote.
+_DOMAIN_INFO_IS_MESSAGE = {
+    f.name: f.message_type is not None
+    for f in schema_pb2.Feature.DESCRIPTOR.oneofs_by_name["domain_info"].fields
+}
+
+
 def _copy_domain_info(origin, dest):
   """Copy the domain info."""
   one_of_field_name = origin.WhichOneof("domain_info")
@@ -196,13 +214,20 @@ def _copy_domain_info(origin, dest):
     return
 
   origin_field = getattr(origin, one_of_field_name)
-
-  field_descriptor = origin.DESCRIPTOR.fields_by_name.get(one_of_field_name)
-  if field_descriptor is None or field_descriptor.message_type is None:
-    setattr(dest, one_of_field_name, origin_field)
+  if _DOMAIN_INFO_IS_MESSAGE[one_of_field_name]:
+    getattr(dest, one_of_field_name).CopyFrom(origin_field)
   else:
-    dest_field = getattr(dest, one_of_field_name)
-    dest_field.CopyFrom(origin_field)
+    setattr(dest, one_of_field_name, origin_field)
+
+
+# Memoizes the derived feature per (original, parent) feature pair:
+# promote_and_broadcast pipelines construct many PromoteExpressions over the
+# same schema protos, and deriving the feature does a dozen proto operations.
+# Each entry holds weak references to its key protos and evicts itself when
+# either dies, so the cache cannot leak protos or serve an entry for a
+# recycled id. Features are not mutated once attached to an expression,
+# which makes reuse safe.
+_promote_feature_cache = {}
 
 
 def _get_promote_schema_feature(original,
@@ -223,7 +248,25 @@ def _get_promote_schema_feature(original,
   """
   if original is None or parent is None:
     return None
-  result = schema_pb2.Feature()
+  key = (id(original), id(parent))
+  cached = _promote_feature_cache.get(key)
+  if cached is not None:
+    return cached[2]
+  result = _derive_promote_schema_feature(original, parent,
+                                          schema_pb2.Feature())
+
+  def _evict(unused_ref, key=key):
+    _promote_feature_cache.pop(key, None)
+
+  # The weakref callbacks fire before the proto's memory can be reused, so
+  # a stale entry is dropped before its ids could ever alias new objects.
+  _promote_feature_cache[key] = (weakref.ref(original, _evict),
+                                 weakref.ref(parent, _evict), result)
+  return result
+
+
+def _derive_promote_schema_feature(original, parent, result):
+  """Fills in the promoted feature; see _get_promote_schema_feature."""
   result.lifecycle_stage = _min_lifecycle_stage(original.lifecycle_stage,
                                                 parent.lifecycle_stage)
   result.type = original.type
@@ -260,8 +303,7 @@ def _promote_impl(root, p,
   if len(p) < 2:
     raise ValueError("Cannot do a promotion beyond the root: {}".format(str(p)))
   parent_path = p.get_parent()
-  grandparent_path = parent_path.get_parent()
-  new_path = grandparent_path.get_child(new_field_name)
+  new_path = p.grandparent_child(new_field_name)
   return expression_add.add_paths(
       root, {
           new_path:
@@ -17,6 +17,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from struct2tensor import calculate_options
 from struct2tensor import create_expression
 from struct2tensor import path
 from struct2tensor.expression_impl import promote
@@ -271,6 +272,34 @@ class PromoteValuesTest(tf.test.TestCase):
       self.assertAllEqual(parent_index, [0, 1, 1, 1, 2])
       self.assertAllEqual(values, [b"a", b"b", b"c", b"d", b"e"])
 
+  def _promote_and_calculate_with_options(self, options):
+    """Runs promote_anonymous on the nested prensor with the given options."""
+    with self.session(use_gpu=False) as sess:
+      expr = create_expression.create_expression_from_prensor(
+          prensor_test_util.create_nested_prensor())
+      new_root, new_path = promote.promote_anonymous(
+          expr, path.Path(["user", "friends"]))
+      new_field = new_root.get_descendant_or_error(new_path)
+      leaf_node = expression_test_util.calculate_value_slowly(
+          new_field, options=options)
+      parent_index, values = sess.run(
+          [leaf_node.parent_index, leaf_node.values])
+
+      self.assertAllEqual(parent_index, [0, 1, 1, 1, 2])
+      self.assertAllEqual(values, [b"a", b"b", b"c", b"d", b"e"])
+
+  def test_promote_and_calculate_use_int32_indices(self):
+    """The int32 gather path must produce the same int64 parent indices."""
+    options = calculate_options.get_default_options()
+    options.use_int32_indices = True
+    self._promote_and_calculate_with_options(options)
+
+  def test_promote_and_calculate_prefer_embedding_lookup(self):
+    """The embedding_lookup path must match the plain gather path."""
+    options = calculate_options.get_default_options()
+    options.prefer_embedding_lookup = True
+    self._promote_and_calculate_with_options(options)
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -138,6 +138,33 @@ class ExpressionTest(absltest.TestCase):
     self.assertEqual(doc_feature_map["bar"].presence.min_count, 17)
     self.assertIn("keep_me", doc_feature_map)
 
+  def test_freeze(self):
+    expr = create_expression.create_expression_from_prensor(
+        prensor_test_util.create_nested_prensor())
+    plan = expr.freeze()
+    self.assertLen(plan.paths, 6)
+    self.assertLen(plan.exprs, 6)
+    self.assertLen(plan.schema_features, 6)
+    self.assertLen(plan.parent_idx, 6)
+    self.assertEqual(set(plan.paths), set(expr.get_known_descendants()))
+    # The root is first and has no parent.
+    self.assertEqual(plan.paths[0], path.Path([]))
+    self.assertIs(plan.exprs[0], expr)
+    self.assertEqual(plan.parent_idx[0], -1)
+    for index in range(1, len(plan.paths)):
+      p = plan.paths[index]
+      parent = plan.parent_idx[index]
+      # Every node appears after its parent and points back at it.
+      self.assertLess(parent, index)
+      self.assertEqual(plan.paths[parent], p.get_parent())
+      self.assertIs(plan.exprs[index], expr.get_descendant_or_error(p))
+      self.assertIs(plan.schema_features[index],
+                    plan.exprs[index].schema_feature)
+      # Depth-first pre-order: each node's parent is on the stack when the
+      # node is emitted, i.e. it is the previous node or one of its
+      # ancestors.
+      self.assertTrue(p.get_parent().is_ancestor(plan.paths[index - 1]))
+
 
 class ExpressionValuesTest(tf.test.TestCase):
 
@@ -25,7 +25,10 @@ from __future__ import division
 
 from __future__ import print_function
 
+import functools
+import itertools
 import re
+import weakref
 from typing import Sequence, Tuple, Union
 
 from tensorflow_metadata.proto.v0 import path_pb2 as tf_metadata_path_pb2
@@ -39,56 +42,59 @@ _SIMPLE_STEP_REGEX = r"""(?:[A-Za-z0-9_\-]+)"""
 # Prensor library works with such a step fine.
 _MAP_INDEXING_STEP_REGEX = r"""(?:[A-Za-z0-9_\-]+\[[^]]*\])"""
 
+# Compiled once at import: these are matched once per step on every path
+# construction and parse, and re-concatenating and recompiling the pattern
+# per call dominated validation cost.
+_STEP_PATTERN = ("(?:" + _EXTENSION_REGEX + "|" + _SIMPLE_STEP_REGEX + "|" +
+                 _MAP_INDEXING_STEP_REGEX + ")")
+_STEP_RE = re.compile(_STEP_PATTERN)
+# Validates a whole dotted path in one pass; see Path.__init__.
+_FULL_PATH_RE = re.compile(
+    _STEP_PATTERN + r"(?:\." + _STEP_PATTERN + r")*\Z")
+# Captures a simple, extension, or map indexing step, then the next dot or
+# the end of the path.
+_PATH_STEP_SEP_RE = re.compile(
+    "(" + _EXTENSION_REGEX + "|" + _SIMPLE_STEP_REGEX + "|" +
+    _MAP_INDEXING_STEP_REGEX + r""")(\.|$)""")
+
 AnonymousId = int
 Step = Union[AnonymousId, str]  # pylint: disable=invalid-name
 
-_NEXT_ANONYMOUS_FIELD = 0
+# next() on itertools.count is atomic under the GIL, making allocation
+# thread-safe without a lock.
+_ANON_COUNTER = itertools.count()
 
 
 def get_anonymous_field():
   """Gets a globally unique anonymous field."""
-  # TODO(martinz): Add thread safety here.
-  global _NEXT_ANONYMOUS_FIELD
-  result = _NEXT_ANONYMOUS_FIELD
-  _NEXT_ANONYMOUS_FIELD += 1
-  return result
-
-
-def _compare_step(a, b):
-  """Return positive, zero, or negative if a>b, a==b, or a<b, respectively.
+  return next(_ANON_COUNTER)
 
-  AnonymousIds are greater than string values.
 
-  Args:
-    a: A step.
-    b: A step.
-
-  Returns:
-    positive, zero, or negative if a>b, a==b, or a<b, respectively.
-  """
-  aint = isinstance(a, AnonymousId)
-  bint = isinstance(b, AnonymousId)
-
-  if aint == bint:
-    if a > b:
-      return 1
-    elif a < b:
-      return -1
-    return 0
-
-  if aint:
-    return 1
-  return -1
+# Maps a field_list tuple to the shared Path representing it. Paths are
+# immutable, so interning derived paths lets repeated traversals share one
+# object (and its precomputed sort key and hash) instead of reallocating it.
+_PATH_INTERN = weakref.WeakValueDictionary()
 
 
 class Path(object):
   """A representation of a path in the expression.
 
-  Do not implement __nonzero__, __eq__, __ne__, et cetera as these are
-  implicitly defined by __cmp__ and __len__.
+  Paths are ordered lexicographically: if one path is a strict prefix of the
+  other, the prefix is less. AnonymousIds are greater than string steps.
 
   """
 
+  # Paths are created in large numbers during expression building; __slots__
+  # drops the per-instance __dict__. __weakref__ is required by the interning
+  # table above.
+  __slots__ = [
+      "field_list",
+      "_sort_key",
+      "_hash",
+      "_str_cache",
+      "__weakref__",
+  ]
+
   def __init__(self, field_list):
     """Create a path object.
 
@@ -98,56 +104,81 @@ class Path(object):
     Raises:
       ValueError: if any field is not a valid step (see is_valid_step).
     """
+    field_list = tuple(field_list)
+    # Fast path: validate every step with a single regex pass over the
+    # joined string. Only sound for steps free of ".", "(" and "[", since
+    # otherwise a pair of invalid steps could join into text that parses
+    # as one valid extension or map indexing step.
+    if field_list and all(
+        type(f) is str and "." not in f and "(" not in f and "[" not in f
+        for f in field_list) and _FULL_PATH_RE.match(".".join(field_list)):
+      self._init_validated(field_list)
+      return
     for field in field_list:
       if isinstance(field, str) and not is_valid_step(field):
         raise ValueError('Field "' + field + '" is invalid.')
-    self.field_list = tuple(field_list)
-
-  def __cmp__(self, other):
-    """Lexicographical ordering of paths.
-
-    If one path is a strict prefix of the other, the prefix is less.
-    Otherwise, the prefix of the longer path is compared to the shorter path.
-
-    Args:
-      other: the path to compare to.
-
-    Returns:
-     -1, 0, or 1 if this is <,==, or > other
-    """
-    for i in range(min(len(self.field_list), len(other.field_list))):
-      step_diff = _compare_step(self.field_list[i], other.field_list[i])
-      if step_diff > 0:
-        return step_diff
-      if step_diff < 0:
-        return step_diff
-    len_diff = len(self.field_list) - len(other.field_list)
-    if len_diff > 0:
-      return 1
-    if len_diff < 0:
-      return -1
-    return 0
+    self._init_validated(field_list)
+
+  def _init_validated(self, field_list):
+    """Initializes from a tuple of steps already known to be valid."""
+    self.field_list = field_list
+    # Tagging each step with whether it is an AnonymousId makes the ordering
+    # (AnonymousIds after strings) a plain tuple comparison, which runs in C
+    # instead of a Python loop with per-step isinstance dispatch.
+    self._sort_key = tuple(
+        (1, f) if isinstance(f, AnonymousId) else (0, f)
+        for f in field_list)
+    self._hash = hash(field_list)
+    self._str_cache = None
+
+  @classmethod
+  def _from_validated(cls, field_list):
+    """Creates a Path from steps already known to be valid, skipping checks."""
+    result = cls.__new__(cls)
+    result._init_validated(tuple(field_list))
+    return result
 
   def __eq__(self, other):
-    return self.__cmp__(other) == 0
+    return self.field_list == other.field_list
 
   def __ne__(self, other):
-    return self.__cmp__(other) != 0
+    return self.field_list != other.field_list
 
   def __le__(self, other):
-    return self.__cmp__(other) <= 0
+    return self._sort_key <= other._sort_key
 
   def __lt__(self, other):
-    return self.__cmp__(other) < 0
+    return self._sort_key < other._sort_key
 
   def __ge__(self, other):
-    return self.__cmp__(other) >= 0
+    return self._sort_key >= other._sort_key
 
   def __gt__(self, other):
-    return self.__cmp__(other) > 0
+    return self._sort_key > other._sort_key
 
   def __hash__(self):
-    return hash(self.field_list)
+    return self._hash
+
+  @classmethod
+  def intern(cls, field_list):
+    """Gets the shared Path for field_list, constructing it if needed.
+
+    The steps must already be valid: every caller passes either slices of a
+    validated path or steps it has just validated, so re-running the step
+    regex here would be pure overhead.
+
+    Args:
+      field_list: a list or tuple of valid steps.
+
+    Returns:
+      The shared Path for field_list.
+    """
+    field_list = tuple(field_list)
+    result = _PATH_INTERN.get(field_list)
+    if result is None:
+      result = cls._from_validated(field_list)
+      _PATH_INTERN[field_list] = result
+    return result
 
   def get_parent(self):
     """Get the parent path.
@@ -160,33 +191,52 @@ class Path(object):
     """
     if not self:
       raise ValueError("Tried to find parent of root")
-    return Path(self.field_list[:-1])
+    return Path.intern(self.field_list[:-1])
 
   def get_child(self, field_name):
     """Get the child path."""
     if isinstance(field_name, str) and not is_valid_step(field_name):
       raise ValueError("field_name is not valid: " + field_name)
-    return Path(self.field_list + (field_name,))
+    return Path.intern(self.field_list + (field_name,))
+
+  def grandparent_child(self, field_name):
+    """Get the path where this path's grandparent has child field_name.
+
+    Equivalent to get_parent().get_parent().get_child(field_name), but
+    slices the step tuple once instead of building the two intermediate
+    paths.
+
+    Args:
+      field_name: the field of the new path's last step.
+
+    Returns:
+      The new path.
+
+    Raises:
+      ValueError: if this path has no grandparent or field_name is invalid.
+    """
+    if isinstance(field_name, str) and not is_valid_step(field_name):
+      raise ValueError("field_name is not valid: " + field_name)
+    if len(self.field_list) < 2:
+      raise ValueError("Tried to find grandparent of " + str(self))
+    return Path.intern(self.field_list[:-2] + (field_name,))
 
   def concat(self, other_path):
-    return Path(self.field_list + other_path.field_list)
+    return Path.intern(self.field_list + other_path.field_list)
 
   def prefix(self, ending_index):
-    return Path(self.field_list[:ending_index])
+    return Path.intern(self.field_list[:ending_index])
 
   def suffix(self, starting_index):
-    return Path(self.field_list[starting_index:])
+    return Path.intern(self.field_list[starting_index:])
 
   def __len__(self):
     return len(self.field_list)
 
   def _get_least_common_ancestor_len(self, other):
     """Get the length of the LCA path (the longest shared prefix)."""
-    min_length = min(len(self.field_list), len(other.field_list))
-    for i in range(min_length):
-      if self.field_list[i] != other.field_list[i]:
-        return i
-    return min_length
+    return sum(1 for _ in itertools.takewhile(
+        lambda ab: ab[0] == ab[1], zip(self.field_list, other.field_list)))
 
   def get_least_common_ancestor(self, other):
     """Get the least common ancestor, the longest shared prefix."""
@@ -195,8 +245,8 @@ class Path(object):
 
   def is_ancestor(self, other):
     """True if self is ancestor of other (i.e. a prefix)."""
-    return len(self.field_list) <= len(other.field_list) and self == Path(
-        other.field_list[:len(self.field_list)])
+    n = len(self.field_list)
+    return n <= len(other.field_list) and self.field_list == other.field_list[:n]
 
   def as_proto(self):
     """Serialize a path as a proto.
@@ -206,14 +256,15 @@ class Path(object):
     Returns:
       a Path proto.
     """
-    result = tf_metadata_path_pb2.Path()
     for x in self.field_list:
-      if isinstance(x, str):
-        result.step.append(x)
-      elif isinstance(x, AnonymousId):
-        raise ValueError("Cannot serialize a path with anonymous fields")
-      else:
+      if not isinstance(x, str):
+        if isinstance(x, AnonymousId):
+          raise ValueError("Cannot serialize a path with anonymous fields")
         raise ValueError("Unexpected path element type: %s" % type(x))
+    result = tf_metadata_path_pb2.Path()
+    # A single extend crosses the proto field boundary once instead of once
+    # per step.
+    result.step.extend(self.field_list)
     return result
 
   def __str__(self):
@@ -225,14 +276,18 @@ class Path(object):
     Returns:
       A string representation of the path, using periods.
     """
-    return ".".join([str(x) for x in self.field_list])
+    # Cached: paths are immutable, and str(path) is used as a dict key in
+    # several sparse/ragged tensor map patterns.
+    result = self._str_cache
+    if result is None:
+      result = ".".join(str(x) for x in self.field_list)
+      self._str_cache = result
+    return result
 
 
 def is_valid_step(step_str):
   """Return true if step_str is a valid step (see create_path)."""
-  return re.match(
-      "(?:" + _EXTENSION_REGEX + "|" + _SIMPLE_STEP_REGEX + "|" +
-      _MAP_INDEXING_STEP_REGEX + ")$", step_str, re.VERBOSE) is not None
+  return _STEP_RE.fullmatch(step_str) is not None
 
 
 def is_extension(step_str):
@@ -271,7 +326,10 @@ CoercableToPath = Union[Path, str]
 
 
 def is_map_indexing_step(step):
-  return re.match(_MAP_INDEXING_STEP_REGEX, step, re.VERBOSE) is not None
+  # Steps reaching this point have already been validated (the bracket
+  # characters cannot appear in simple or extension steps), so detecting
+  # the map syntax with string operations avoids a regex engine call.
+  return "[" in step and step.endswith("]")
 
 
 def parse_map_indexing_step(step):
@@ -303,28 +361,36 @@ def create_path(path_source):
   """
   if isinstance(path_source, Path):
     return path_source
+  return _create_path_from_string(path_source)
+
+
+@functools.lru_cache(maxsize=4096)
+def _create_path_from_string(path_source):
+  """Parses a string into an interned Path, memoized per string."""
   if path_source and path_source[-1] == ".":
     # If we removed this then the period at the end would be ignored, and
     # "foo.bar." would become ['foo', 'bar']
     raise ValueError("Path cannot end with .")
   result = []
   path_remaining = path_source
-  # Capture a simple or extension step, then capture the next dot or end.
-  path_step_separator_re = re.compile(
-      "(" + _EXTENSION_REGEX + "|" + _SIMPLE_STEP_REGEX + "|" +
-      _MAP_INDEXING_STEP_REGEX + r""")(\.|$)""", re.VERBOSE)
   while path_remaining:
-    next_match = path_step_separator_re.match(path_remaining)
+    next_match = _PATH_STEP_SEP_RE.match(path_remaining)
     if next_match:
       result.append(next_match.group(1))
       path_remaining = path_remaining[next_match.end():]
     else:
       raise ValueError("Malformed path:  " + path_source)
-  return Path(result)
+  return Path.intern(result)
 
 
 def from_proto(path_proto):
   # Coerce each step to a native string. The steps in the proto are always
   # Unicode strings, but the Path class may contain either unicode or bytes
   # depending on whether this module is loaded with Python2 or Python3.
-  return Path([str(step) for step in path_proto.step])
+  steps = tuple(str(step) for step in path_proto.step)
+  # Proto contents are untrusted, so validate here: intern expects steps
+  # that are already known to be valid.
+  for step in steps:
+    if not is_valid_step(step):
+      raise ValueError('Field "' + step + '" is invalid.')
+  return Path.intern(steps)
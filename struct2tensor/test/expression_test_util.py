@@ -21,6 +21,9 @@ from __future__ import division
 
 from __future__ import print_function
 
+import bisect
+import weakref
+
 from struct2tensor import calculate
 from struct2tensor import calculate_options
 from struct2tensor import expression
@@ -32,6 +35,24 @@ from typing import FrozenSet, Optional, Mapping, Sequence, Text
 
 from tensorflow_metadata.proto.v0 import schema_pb2
 
+# Mock expressions are built by the thousand across the test suite, mostly
+# with empty or identical child-name sets; share one frozenset per distinct
+# name set instead of allocating a fresh one per expression.
+_EMPTY_FIELD_NAMES = frozenset()
+_field_names_cache = {}
+
+# Shared default options for the helpers below. get_default_options returns
+# a fresh mutable object on each call; the helpers never modify it, so one
+# instance can serve every calculation.
+_default_options = None
+
+
+def _get_default_options():
+  global _default_options
+  if _default_options is None:
+    _default_options = calculate_options.get_default_options()
+  return _default_options
+
 
 def calculate_value_slowly(
     expr,
@@ -39,8 +60,10 @@ def calculate_value_slowly(
     options = None):
   """A calculation of the node tensor of an expression, without optimization.
 
-  This will not do any common subexpression elimination or caching of
-  node tensors, and will likely be very slow for larger operations.
+  This will not do any common subexpression elimination across calls, but
+  within one call each distinct expression object is calculated exactly
+  once, so a DAG with shared source expressions does not take time
+  exponential in its depth.
 
   Args:
     expr: The expression to calculate.
@@ -50,30 +73,137 @@ def calculate_value_slowly(
   Returns:
     The node tensor of the expression.
   """
-  new_options = calculate_options.get_default_options(
-  ) if options is None else options
+  new_options = _get_default_options() if options is None else options
+  return _calculate_value_slowly_cached(expr, destinations, new_options, {})
 
-  source_node_tensors = [
-      calculate_value_slowly(x, [expr], new_options)
-      for x in expr.get_source_expressions()
-  ]
-  real_dest = [] if destinations is None else destinations
-  return expr.calculate(source_node_tensors, real_dest, new_options)
+
+def _is_identity(expr):
+  """True if expr's calculation is the identity.
+
+  Reads the mock's flag directly when present — the traversal checks this
+  once per node, and the method dispatch is measurable on large DAGs —
+  falling back to the method for other expression types.
+  """
+  flag = getattr(expr, "_calculate_is_identity", None)
+  if flag is None:
+    return expr.calculation_is_identity()
+  return flag
+
+
+def _calculate_value_slowly_cached(expr, destinations, options, cache):
+  """Calculates expr, computing each distinct expression in the DAG once.
+
+  Calculations can be destination-sensitive (e.g. proto expressions parse
+  only the fields their destinations need), so a shared node must see every
+  destination, not just the parent that happened to reach it first. A
+  pre-pass gathers the full destination list per node, the way the
+  optimized calculate graph does, before anything is calculated.
+
+  Args:
+    expr: The expression to calculate.
+    destinations: Where the calculation will be used (None implies directly)
+    options: Calculation options for individual calculations
+    cache: maps id(expression) to its already calculated node tensor.
+      Caching by id preserves tensor object identity, which
+      MockExpression.calculate checks for.
+
+  Returns:
+    The node tensor of the expression.
+  """
+  # Pre-pass: dispatch get_source_expressions once per distinct node and
+  # accumulate each node's destinations over all of its incoming edges.
+  sources_by_id = {}
+  dests_by_id = {id(expr): [] if destinations is None else list(destinations)}
+  pending = [expr]
+  while pending:
+    node = pending.pop()
+    node_id = id(node)
+    if node_id in sources_by_id:
+      continue
+    sources = node.get_source_expressions()
+    sources_by_id[node_id] = sources
+    for x in sources:
+      x_id = id(x)
+      x_dests = dests_by_id.get(x_id)
+      if x_dests is None:
+        dests_by_id[x_id] = [node]
+      else:
+        x_dests.append(node)
+      if x_id not in sources_by_id:
+        pending.append(x)
+  # Iterative post-order traversal: a node is first expanded (pushing its
+  # sources), then revisited once every source tensor is in the cache.
+  # Avoids one Python stack frame per node and the recursion limit on
+  # deep expression trees.
+  stack = [(expr, False)]
+  while stack:
+    node, expanded = stack.pop()
+    node_id = id(node)
+    if node_id in cache:
+      continue
+    sources = sources_by_id[node_id]
+    if not expanded:
+      stack.append((node, True))
+      for x in sources:
+        if id(x) not in cache:
+          stack.append((x, False))
+      continue
+    source_node_tensors = [cache[id(x)] for x in sources]
+    if len(source_node_tensors) == 1 and _is_identity(node):
+      # An identity calculation forwards its single source's tensor; skip
+      # the calculate dispatch.
+      result = source_node_tensors[0]
+    else:
+      result = node.calculate(source_node_tensors, dests_by_id[node_id],
+                              options)
+    cache[node_id] = result
+  return cache[id(expr)]
+
+
+def _nested_list(flat_values, nested_row_splits):
+  """Reassembles numpy ragged components into a nested list."""
+  result = flat_values.tolist()
+  for row_splits in reversed(nested_row_splits):
+    result = [
+        result[start:end] for start, end in zip(row_splits[:-1], row_splits[1:])
+    ]
+  return result
 
 
 def calculate_list_map(expr, sess):
   """Calculate a map from paths to nested lists, representing the leafs."""
   [my_prensor] = calculate.calculate_prensors([expr])
   ragged_tensor_map = prensor_util.get_ragged_tensors(
-      my_prensor, calculate_options.get_default_options())
-  string_tensor_map = {str(k): v for k, v in ragged_tensor_map.items()}
-  string_np_map = sess.run(string_tensor_map)
-  return {k: v.to_list() for k, v in string_np_map.items()}
+      my_prensor, _get_default_options())
+  # Fetch the flat components of every ragged tensor in a single run and
+  # reassemble the nested lists in numpy, instead of fetching composite
+  # RaggedTensor values and converting each one with to_list().
+  component_map = {
+      str(k): (v.flat_values, v.nested_row_splits)
+      for k, v in ragged_tensor_map.items()
+  }
+  np_map = sess.run(component_map)
+  return {
+      k: _nested_list(flat_values, nested_row_splits)
+      for k, (flat_values, nested_row_splits) in np_map.items()
+  }
 
 
 class MockExpression(expression.Expression):
   """The mock expression is designed to test calculations."""
 
+  __slots__ = [
+      "_name",
+      "_source_expressions",
+      "_expected_source_ids",
+      "_num_expected_sources",
+      "_calculate_output",
+      "_calculate_is_identity",
+      "_children_names",
+      "_children_values",
+      "_known_field_names",
+  ]
+
   def __init__(
       self,
       is_repeated,
@@ -101,19 +231,31 @@ class MockExpression(expression.Expression):
     super(MockExpression, self).__init__(
         is_repeated, my_type, schema_feature=schema_feature)
     self._name = "Unknown" if name is None else name
-    self._source_expressions = []
-    if source_expressions is not None:
-      self._source_expressions = source_expressions
-    self._expected_source_tensors = [
-        x.calculate_output for x in self._source_expressions
-    ]
+    self._source_expressions = tuple(
+        source_expressions) if source_expressions is not None else ()
+    # Only the ids are needed for the identity validation in calculate.
+    # Each tensor stays alive through its own source expression, which
+    # _source_expressions keeps a strong reference to, so the ids are
+    # stable without pinning a second reference per tensor here.
+    self._expected_source_ids = tuple(
+        id(x.calculate_output) for x in self._source_expressions)
+    self._num_expected_sources = len(self._expected_source_ids)
     self._calculate_output = calculate_output
     self._calculate_is_identity = calculate_is_identity
-    self._children = {} if children is None else children
-    if known_field_names is None:
-      self._known_field_names = frozenset(self._children.keys())
-    else:
+    # Child maps are tiny, so sorted parallel tuples with bisect lookup
+    # carry less overhead than a dict per mock.
+    children = {} if children is None else children
+    self._children_names = tuple(sorted(children))
+    self._children_values = tuple(
+        children[name] for name in self._children_names)
+    if known_field_names is not None:
       self._known_field_names = known_field_names
+    elif not self._children_names:
+      self._known_field_names = _EMPTY_FIELD_NAMES
+    else:
+      key = self._children_names
+      self._known_field_names = _field_names_cache.setdefault(
+          key, frozenset(key))
 
   @property
   def calculate_output(self):
@@ -128,22 +270,30 @@ class MockExpression(expression.Expression):
   def calculate(self, source_tensors,
                 destinations,
                 options):
-    if len(source_tensors) != len(self._expected_source_tensors):
-      raise ValueError("Unexpected number of inputs for {}.".format(self._name))
-    for i in range(len(source_tensors)):
-      if self._expected_source_tensors[i] is not source_tensors[i]:
-        raise ValueError("Error calculating " + self._name)
+    if tuple(map(id, source_tensors)) != self._expected_source_ids:
+      if len(source_tensors) != self._num_expected_sources:
+        raise ValueError(
+            "Unexpected number of inputs for {}.".format(self._name))
+      raise ValueError("Error calculating " + self._name)
     return self._calculate_output
 
   def calculation_is_identity(self):
     return self._calculate_is_identity
 
   def calculation_equal(self, expr):
-    return self.calculation_is_identity() and expr.calculation_is_identity()
+    # Read the flag directly so the common non-identity case exits without
+    # any method dispatch.
+    return self._calculate_is_identity and expr.calculation_is_identity()
 
   def _get_child_impl(self,
                       field_name):
-    return self._children.get(field_name)
+    names = self._children_names
+    if not names:
+      return None
+    i = bisect.bisect_left(names, field_name)
+    if i < len(names) and names[i] == field_name:
+      return self._children_values[i]
+    return None
 
   def known_field_names(self):
     return self._known_field_names
@@ -152,6 +302,27 @@ class MockExpression(expression.Expression):
     return str(self._name)
 
 
+# One empty tensor per (graph, dtype): each tf.constant call adds a node to
+# the default graph, and the helpers below created two per mock leaf. The
+# cache is keyed per graph because a tensor cannot be used outside the graph
+# it was created in; the weak keying lets a graph (and its tensors) be
+# collected once the tests using it are done with it.
+_empty_tensor_cache = weakref.WeakKeyDictionary()
+
+
+def _empty_tensor(dtype):
+  graph = tf.compat.v1.get_default_graph()
+  per_graph = _empty_tensor_cache.get(graph)
+  if per_graph is None:
+    per_graph = {}
+    _empty_tensor_cache[graph] = per_graph
+  tensor = per_graph.get(dtype)
+  if tensor is None:
+    tensor = tf.constant([], dtype=dtype)
+    per_graph[dtype] = tensor
+  return tensor
+
+
 def get_mock_leaf(is_repeated,
                   my_type,
                   name = None,
@@ -162,8 +333,7 @@ def get_mock_leaf(is_repeated,
     calculate_output = source_expressions[0].calculate_output
   else:
     calculate_output = prensor.LeafNodeTensor(
-        tf.constant([], dtype=tf.int64), tf.constant([], dtype=my_type),
-        is_repeated)
+        _empty_tensor(tf.int64), _empty_tensor(my_type), is_repeated)
   return MockExpression(
       is_repeated,
       my_type,
@@ -204,7 +374,7 @@ def get_mock_broken_leaf(
     calculate_output = source_expressions[0].calculate_output
   else:
     calculate_output = prensor.LeafNodeTensor(
-        tf.constant([], dtype=tf.int64), tf.constant([], dtype=actual_type),
+        _empty_tensor(tf.int64), _empty_tensor(actual_type),
         actual_is_repeated)
   return MockExpression(
       declared_is_repeated,